@@ -0,0 +1,50 @@
+import os # Import the os module for path manipulation
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- One-off conversion of the ESG CSVs to Parquet ---
+# Run this once (`python csvs_to_parquet.py`) after placing or updating the CSV files.
+# gd.py reads the resulting `.parquet` files instead of the CSVs whenever they exist.
+
+# Keep these paths in sync with the configuration at the top of gd.py.
+SCRIPT_DIR = os.path.dirname(__file__)
+DATA_FOLDER = os.path.join(SCRIPT_DIR, 'data')
+ESG_DATA_PATH = os.path.join(DATA_FOLDER, 'esg_data.csv')
+ESG_SERIES_PATH = os.path.join(DATA_FOLDER, 'esg_series.csv')
+
+# Explicit column types. Repeated strings become categories; numbers are coerced and downcast after the read.
+# Columns that are not present in a file are simply ignored by `pd.read_csv`.
+ESG_DATA_DTYPES = {
+    'Series Code': 'category',
+    'Country Code': 'category',
+    'Country Name': 'category',
+    'Indicator Name': 'category',
+    'Indicator Code': 'category',
+}
+ESG_SERIES_DTYPES = {
+    'Series Code': 'category',
+    'Series Name': 'category',
+}
+
+
+def convert(csv_path, dtypes):
+    """
+    Reads one CSV with explicit dtypes and writes it next to the source as zstd-compressed Parquet.
+    """
+    df = pd.read_csv(csv_path, dtype=dtypes)
+    # 'Year' and 'Value' may contain blanks or missing markers such as '..', so they are coerced
+    # (as gd.py does) rather than parsed as int16/float32 directly
+    if 'Year' in df.columns:
+        df['Year'] = pd.to_numeric(df['Year'], errors='coerce').astype('Int16')
+    if 'Value' in df.columns:
+        df['Value'] = pd.to_numeric(df['Value'], errors='coerce').astype('float32')
+
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), parquet_path, compression="zstd")
+    print(f"Wrote {len(df):,} rows from '{csv_path}' to '{parquet_path}'.")
+
+
+if __name__ == "__main__":
+    convert(ESG_DATA_PATH, ESG_DATA_DTYPES)
+    convert(ESG_SERIES_PATH, ESG_SERIES_DTYPES)
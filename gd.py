@@ -1,7 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np # Import numpy for the combined filter mask
 import os # Import the os module for path manipulation
+import glob # Import glob to clean up stale cache files
+import uuid # Import uuid to tag each loaded frame with a cache key
+from concurrent.futures import ThreadPoolExecutor # Import ThreadPoolExecutor to read both data files at once
 import plotly.express as px # Import plotly for visualizations
+import pyarrow as pa # Import pyarrow for Parquet reads and its error types
 
 # --- Configuration for File Paths ---
 # Get the directory of the current script.
@@ -24,14 +29,40 @@ ESG_SERIES_PATH = os.path.join(DATA_FOLDER, 'esg_series.csv')
 # ESG_DATA_PATH = '/path/to/your/esg_data.csv' # Example: '/home/user/my_app/data/esg_data.csv' or 'C:/Users/YourUser/Documents/esg_data.csv'
 # ESG_SERIES_PATH = '/path/to/your/esg_series.csv' # Example: '/home/user/my_app/data/esg_series.csv' or 'C:/Users/YourUser/Documents/esg_series.csv'
 
+# Parquet copies of the CSVs (created once by running `python csvs_to_parquet.py`).
+# When present they are read instead of the CSVs: no CSV tokenizing, and the column types are stored in the file.
+# A CSV edited after its Parquet copy was written takes precedence until the converter is re-run.
+ESG_DATA_PARQUET_PATH = os.path.splitext(ESG_DATA_PATH)[0] + '.parquet'
+ESG_SERIES_PARQUET_PATH = os.path.splitext(ESG_SERIES_PATH)[0] + '.parquet'
 
-@st.cache_data
-def load_data():
+# Set the ESG_DEBUG environment variable (e.g. `ESG_DEBUG=1 streamlit run gd.py`) to show load diagnostics.
+DEBUG = bool(os.environ.get("ESG_DEBUG"))
+
+# Column types applied right after reading the CSVs. Repeated labels become categoricals
+# instead of one Python string per row. Columns that are missing from a file are ignored.
+ESG_DATA_DTYPES = {'Series Code': 'category', 'Country Code': 'category', 'Country Name': 'category',
+                   'Indicator Name': 'category', 'Indicator Code': 'category'}
+ESG_SERIES_DTYPES = {'Series Code': 'category', 'Series Name': 'category'}
+
+# On-disk cache of the merged result, so a fresh server process skips the file parsing and the merge.
+# The file names carry the newest modification time of the source files, so editing (or converting)
+# a source file makes the old cache stale. Bump CACHE_VERSION when the merge logic changes.
+CACHE_FOLDER = os.path.join(SCRIPT_DIR, '.cache')
+CACHE_VERSION = 7
+
+# The line chart switches from SVG to WebGL rendering above this many plotted points
+WEBGL_POINT_THRESHOLD = 1000
+
+
+def _read_and_merge():
     """
     Loads ESG data and series data, and merges them.
     Includes robust error handling for common merging issues.
+    Errors are reported from in here and stop the app. Warnings (e.g. a renamed key column) are not
+    shown here but stored in the merged frame's `attrs['load_warnings']`, so they are cached with it
+    and the page can show them on every run, including loads served from the cache.
     """
-    st.subheader("Data Loading Process:")
+    load_warnings = []
 
     # 1. Critical Check: Ensure the data folder exists if using a subfolder setup (Recommended option)
     # This check specifically targets the 'data' subfolder setup.
@@ -46,58 +77,71 @@ def load_data():
     esg_data = pd.DataFrame()
     esg_series = pd.DataFrame()
 
+    # Function to read a data file, preferring its Parquet copy over the CSV when one exists
+    # and is not older than the CSV (a stale copy is ignored rather than showing outdated data).
+    # CSVs are parsed with the multi-threaded pyarrow reader rather than pandas' single-threaded C parser.
+    def read_table(csv_path, parquet_path, dtypes):
+        if os.path.exists(parquet_path) and not (
+                os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(parquet_path)):
+            return pd.read_parquet(parquet_path, engine="pyarrow")
+        # The types are applied after the read: with `dtype=`, pandas' pyarrow engine re-casts every column,
+        # which fails on integer-valued columns with blank cells (e.g. a missing 'Year')
+        df = pd.read_csv(csv_path, engine="pyarrow")
+        return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
     # 3. Load the dataframes with individual file existence checks
     try:
-        if not os.path.exists(ESG_DATA_PATH):
+        if not os.path.exists(ESG_DATA_PATH) and not os.path.exists(ESG_DATA_PARQUET_PATH):
             st.error(f"Error: `esg_data.csv` not found at the expected path: '{ESG_DATA_PATH}'.")
             st.info("Please ensure the file exists and the `ESG_DATA_PATH` configuration in the code is correct.")
             st.stop()
-        esg_data = pd.read_csv(ESG_DATA_PATH)
-        st.success(f"Successfully loaded `esg_data.csv` from '{ESG_DATA_PATH}'.")
 
-        if not os.path.exists(ESG_SERIES_PATH):
+        if not os.path.exists(ESG_SERIES_PATH) and not os.path.exists(ESG_SERIES_PARQUET_PATH):
             st.error(f"Error: `esg_series.csv` not found at the expected path: '{ESG_SERIES_PATH}'.")
             st.info("Please ensure the file exists and the `ESG_SERIES_PATH` configuration in the code is correct.")
             st.stop()
-        esg_series = pd.read_csv(ESG_SERIES_PATH)
-        st.success(f"Successfully loaded `esg_series.csv` from '{ESG_SERIES_PATH}'.")
+
+        # Both files are read at the same time; the pyarrow readers release the GIL while parsing.
+        # read_table makes no Streamlit calls, and `.result()` re-raises any read error here, in this thread.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            data_future = executor.submit(read_table, ESG_DATA_PATH, ESG_DATA_PARQUET_PATH, ESG_DATA_DTYPES)
+            series_future = executor.submit(read_table, ESG_SERIES_PATH, ESG_SERIES_PARQUET_PATH, ESG_SERIES_DTYPES)
+            esg_data = data_future.result()
+            esg_series = series_future.result()
 
     except pd.errors.EmptyDataError:
         st.error("Error: One of your CSV files is empty. Please check the content.")
         st.stop()
     except pd.errors.ParserError as e:
-        st.error(f"Error parsing CSV file: {e}. Check if your CSV is well-formed.")
+        # The pyarrow CSV reader reports an empty file as a ParserError rather than EmptyDataError
+        if 'Empty CSV file' in str(e):
+            st.error("Error: One of your CSV files is empty. Please check the content.")
+        else:
+            st.error(f"Error parsing CSV file: {e}. Check if your CSV is well-formed.")
+        st.stop()
+    except pa.ArrowInvalid as e:
+        st.error(f"Error reading Parquet file: {e}. Re-run `python csvs_to_parquet.py` to regenerate it.")
         st.stop()
     except Exception as e:
         st.error(f"An unexpected error occurred while loading data: {e}")
         st.stop()
 
-    # --- Debugging and Column Name Handling for Merge ---
-    st.subheader("Column Information Before Merge:")
-    st.write("Columns in `esg_data`:", esg_data.columns.tolist())
-    st.write("Columns in `esg_series`:", esg_series.columns.tolist())
-
+    # --- Column Name Handling for Merge ---
     # Define the expected merge key
     merge_key = 'Series Code'
-    st.info(f"Attempting to merge on column: '{merge_key}'")
 
     # Function to check and potentially rename a column
     def ensure_merge_key(df, df_name):
-        cols = df.columns.tolist()
-        if merge_key not in cols:
-            st.warning(f"Warning: '{merge_key}' not found in `{df_name}`.")
-            st.info(f"Attempting to find similar column names in `{df_name}` for a potential rename.")
-            found = False
-            for col in cols:
-                # Case-insensitive and space/underscore insensitive comparison
-                if col.lower().replace('_', ' ').strip() == merge_key.lower().replace('_', ' ').strip():
-                    st.info(f"Renaming '{col}' in `{df_name}` to '{merge_key}'.")
-                    df = df.rename(columns={col: merge_key})
-                    found = True
-                    break
-            if not found:
+        if merge_key not in df.columns:
+            # Case-insensitive and space/underscore insensitive comparison, done on all column names at once
+            normalized = df.columns.str.lower().str.replace('_', ' ', regex=False).str.strip()
+            hits = np.flatnonzero(normalized == merge_key.lower().replace('_', ' ').strip())
+            if hits.size == 0:
                 st.error(f"Could not find a suitable column to rename in `{df_name}` to '{merge_key}'. Merge will likely fail.")
                 return None, False # Indicate failure
+            col = df.columns[hits[0]]
+            load_warnings.append(f"Warning: '{merge_key}' not found in `{df_name}`, using its '{col}' column instead.")
+            df = df.rename(columns={col: merge_key})
         return df, True # Indicate success
 
     esg_data, data_key_ok = ensure_merge_key(esg_data, 'esg_data')
@@ -107,24 +151,59 @@ def load_data():
         st.error("Merge cannot proceed because the required merge key is missing or could not be corrected in one or both dataframes.")
         st.stop()
 
-    # Ensure the merge key column is of the same type (e.g., string)
+    # Function to normalise a key column to text, so codes that parse as numbers in one file and as strings
+    # in the other still match. Missing cells stay missing, and whole-number floats (integer codes with
+    # blank cells) lose their '.0'.
+    def key_as_text(values):
+        values = values.astype(object).infer_objects()
+        if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+            values = values.astype('Int64')
+        return values.astype('string')
+
+    # Encode the merge key as a categorical with one shared set of categories in both dataframes,
+    # so the join compares integer codes instead of hashing strings
     try:
-        esg_data[merge_key] = esg_data[merge_key].astype(str)
-        esg_series[merge_key] = esg_series[merge_key].astype(str)
-        st.info(f"Successfully converted '{merge_key}' column to string type in both dataframes.")
+        esg_data[merge_key] = key_as_text(esg_data[merge_key])
+        esg_series[merge_key] = key_as_text(esg_series[merge_key])
+        key_categories = pd.Index(pd.concat([esg_data[merge_key], esg_series[merge_key]]).dropna().unique())
+        esg_data[merge_key] = pd.Categorical(esg_data[merge_key], categories=key_categories)
+        esg_series[merge_key] = pd.Categorical(esg_series[merge_key], categories=key_categories)
     except Exception as e:
-        st.warning(f"Could not convert '{merge_key}' column to string type: {e}. Proceeding with merge, but type mismatch could be an issue.")
-
-
-    st.success(f"Both dataframes are ready for merge with a '{merge_key}' column.")
+        load_warnings.append(f"Could not convert '{merge_key}' column to a categorical type: {e}. Proceeding with merge, but type mismatch could be an issue.")
 
-    # Perform the merge
+    # Perform the merge (a left join of esg_data against esg_series indexed by the key).
+    # Columns present in both dataframes are kept from esg_data only, so no '_x'/'_y' duplicates are created.
     try:
-        merged_data = pd.merge(esg_data, esg_series, on=merge_key, how='left')
-        st.success("Data merged successfully!")
-        st.write("Shape of merged data:", merged_data.shape)
-        st.dataframe(merged_data.head()) # Show a preview of the merged data
-        return merged_data
+        overlap = esg_series.columns.intersection(esg_data.columns).drop(merge_key)
+        # 'Definition' is long text that is only shown in the data dictionary (built from esg_series below),
+        # so it is not joined onto every row
+        series_lookup = esg_series.drop(columns=overlap.union(['Definition']), errors='ignore').set_index(merge_key)
+        # The joined text columns repeat one value per series on every row, so they are made categorical
+        # first: the join then copies small integer codes instead of a string per row
+        text_cols = series_lookup.select_dtypes(include=['object', 'string']).columns
+        series_lookup = series_lookup.astype({col: 'category' for col in text_cols})
+        # validate='m:1' checks up front that each series appears only once in esg_series
+        merged_data = esg_data.join(series_lookup, on=merge_key, how='left', sort=False, validate='m:1')
+        # Repeated label columns become categoricals, so filters compare integer codes instead of strings
+        # (unused categories are dropped so the categories list exactly the values present, and they are
+        # put in sorted order once here so the sidebar can use them as-is)
+        for col in ['Country Name', 'Series Name']:
+            if col in merged_data.columns:
+                categories = merged_data[col].astype('category').cat.remove_unused_categories()
+                merged_data[col] = categories.cat.reorder_categories(categories.cat.categories.sort_values(), ordered=True)
+        # Numeric columns are coerced once here (and stored compactly) instead of on every rerun
+        if 'Value' in merged_data.columns:
+            merged_data['Value'] = pd.to_numeric(merged_data['Value'], errors='coerce').astype('float32')
+        if 'Year' in merged_data.columns:
+            merged_data['Year'] = pd.to_numeric(merged_data['Year'], errors='coerce').astype('Int16')
+        # Rows are ordered by country (in category code order) and year, so each country's rows form one
+        # contiguous block that the country filter finds with a binary search instead of a full-length mask
+        sort_cols = [col for col in ['Country Name', 'Year'] if col in merged_data.columns]
+        if sort_cols:
+            merged_data = merged_data.sort_values(sort_cols, na_position='first', kind='stable', ignore_index=True)
+    except pd.errors.MergeError as e:
+        st.error(f"Merge failed: {e}. Each '{merge_key}' must appear only once in `esg_series`; please remove the duplicate rows.")
+        st.stop()
     except KeyError as e:
         st.error(f"Merge failed due to a KeyError: {e}. This indicates a problem with the merge key even after checks.")
         st.error("Double-check column names and data types, and ensure there's truly a common key.")
@@ -133,13 +212,185 @@ def load_data():
         st.error(f"An unexpected error occurred during the merge operation: {e}")
         st.stop()
 
+    # The data dictionary only depends on esg_series, so it is built here once instead of from the merged rows
+    series_dict = None
+    if 'Series Name' in esg_series.columns and 'Definition' in esg_series.columns:
+        series_dict = esg_series[[merge_key, 'Series Name', 'Definition']].drop_duplicates().set_index(merge_key)
+
+    merged_data.attrs['load_warnings'] = load_warnings
+    return merged_data, series_dict
+
+
+def _merged_cache_paths():
+    """
+    Returns the (merged frame, data dictionary) cache file paths for the current source files,
+    or (None, None) if no source file exists yet.
+    """
+    sources = [p for p in (ESG_DATA_PATH, ESG_DATA_PARQUET_PATH, ESG_SERIES_PATH, ESG_SERIES_PARQUET_PATH) if os.path.exists(p)]
+    if not sources:
+        return None, None
+    stamp = max(os.stat(p).st_mtime_ns for p in sources)
+    return (os.path.join(CACHE_FOLDER, f'esg_merged_v{CACHE_VERSION}_{stamp}.parquet'),
+            os.path.join(CACHE_FOLDER, f'esg_series_dict_v{CACHE_VERSION}_{stamp}.parquet'))
+
+
+def _write_parquet_atomically(df, path):
+    """
+    Writes `df` to `path` under a temporary name and renames it into place, so a concurrent
+    reader sees either no file or the complete one, never a half-written file.
+    """
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@st.cache_resource(show_spinner=False)
+def _load_and_merge():
+    """
+    Returns the merged ESG frame and data dictionary, from the on-disk cache when it is current,
+    otherwise by reading and merging the source files (and then refreshing the on-disk cache).
+    The result is cached as a single shared object (no hashing or copying on every rerun),
+    so it must never be mutated by the caller.
+    """
+    merged_path, series_dict_path = _merged_cache_paths()
+    merged_data, series_dict = None, None
+
+    if merged_path is not None and os.path.exists(merged_path):
+        try:
+            merged_data = pd.read_parquet(merged_path, engine="pyarrow")
+            # The merged file records whether a data dictionary belongs with it, so a missing
+            # dictionary file is an incomplete cache (rebuilt below), not "no dictionary"
+            if merged_data.attrs.get('has_series_dict'):
+                series_dict = pd.read_parquet(series_dict_path, engine="pyarrow")
+        except (OSError, pa.ArrowInvalid):
+            merged_data, series_dict = None, None # Unreadable or incomplete cache: rebuild it below
+
+    if merged_data is None:
+        merged_data, series_dict = _read_and_merge()
+        merged_data.attrs['has_series_dict'] = series_dict is not None
+        # Writing the cache is best-effort; the app works the same without it.
+        # The dictionary is written before the merged file, so an existing merged file means a complete cache.
+        try:
+            os.makedirs(CACHE_FOLDER, exist_ok=True)
+            current = (os.path.basename(merged_path), os.path.basename(series_dict_path))
+            for stale in glob.glob(os.path.join(CACHE_FOLDER, 'esg_*')):
+                if not os.path.basename(stale).startswith(current):
+                    os.remove(stale)
+            if series_dict is not None:
+                _write_parquet_atomically(series_dict, series_dict_path)
+            _write_parquet_atomically(merged_data, merged_path)
+        except (OSError, pa.ArrowException):
+            pass
+
+    # Tag this load so small derived results can be cached per load without hashing the frame
+    merged_data.attrs['load_id'] = uuid.uuid4().hex
+    return merged_data, series_dict
+
+
+def load_data():
+    """
+    Returns the merged ESG frame shared by all sessions (not a copy) and the per-series
+    data dictionary (None if esg_series has no 'Series Name'/'Definition' columns).
+    Filter the frame into new frames instead of assigning columns on it.
+    """
+    return _load_and_merge()
+
+
+@st.cache_resource(show_spinner=False)
+def sidebar_options(load_id, _df):
+    """
+    Returns the sorted option lists for the Country, Year and Series Name filters (None for a column
+    that is missing). Like the unfiltered app, each list only offers values present under the
+    selections above it: years are keyed by country and series names by (country, year), with 'All'
+    for an unfiltered level, so a rerun only does a dict lookup.
+    Computed once per loaded frame: `load_id` is the cache key and the leading underscore stops
+    Streamlit from hashing the frame itself. The lookups are shared (not copied on every hit),
+    so they must not be modified.
+    """
+    countries = _df['Country Name'].cat.categories.tolist() if 'Country Name' in _df.columns else None
+
+    def year_list(year_col):
+        return np.sort(year_col.dropna().unique().to_numpy(dtype=np.int16))[::-1].tolist()
+
+    years_by_country = None
+    if 'Year' in _df.columns:
+        years_by_country = {'All': year_list(_df['Year'])}
+        if countries is not None:
+            for country, year_col in _df.groupby('Country Name', observed=True)['Year']:
+                years_by_country[country] = year_list(year_col)
+
+    series_by_selection = None
+    if 'Series Name' in _df.columns:
+        # The categories are sorted by the loader, so sorted codes give sorted names
+        categories = _df['Series Name'].cat.categories
+        series_by_selection = {('All', 'All'): categories.tolist()}
+        levels = [col for col in ['Country Name', 'Year'] if col in _df.columns]
+        combos = _df[levels + ['Series Name']].dropna(subset=['Series Name']).drop_duplicates()
+        for by in [[col] for col in levels] + ([levels] if len(levels) == 2 else []):
+            for values, group in combos.groupby(by, observed=True):
+                selection = dict(zip(by, values))
+                key = (selection.get('Country Name', 'All'),
+                       int(selection['Year']) if 'Year' in selection else 'All')
+                series_by_selection[key] = categories[np.unique(group['Series Name'].cat.codes.to_numpy())].tolist()
+
+    return countries, years_by_country, series_by_selection
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def series_trend(load_id, selection, _data):
+    """
+    Returns the average Value per Year and Series Name of the filtered rows, as drawn by the line chart.
+    The loaded frame's `load_id` and the sidebar `selection` together determine `_data`, so they are
+    the cache key, and a repeated selection skips the dropna and groupby over the filtered rows.
+    """
+    # 'Value' and 'Year' are already numeric from the loader, so only missing values need dropping.
+    # Only the three plotted columns are taken, so rows are not copied with every other merged column.
+    plot_data = _data[['Year', 'Value', 'Series Name']].dropna()
+    return plot_data.groupby(['Year', 'Series Name'], observed=True)['Value'].mean().reset_index()
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def build_line_figure(plot_data_agg):
+    """
+    Builds the 'Average ESG Value Trends by Series' line chart.
+    The aggregated frame is small, so hashing it as the cache key is cheap, and a repeated
+    selection reuses the finished figure instead of rebuilding it with Plotly Express.
+    The figure is cached as a shared object (not pickled and copied on every hit), so it
+    must not be modified after it is returned; `max_entries` bounds how many are kept.
+    Large charts (many series selected) are drawn with WebGL, which stays responsive where SVG lags.
+    """
+    fig = px.line(plot_data_agg, x='Year', y='Value', color='Series Name',
+                  title='Average ESG Value Trends by Series',
+                  labels={'Value': 'Average ESG Value', 'Year': 'Year'},
+                  hover_name='Series Name',
+                  markers=True, # Add markers for clarity
+                  render_mode='webgl' if len(plot_data_agg) > WEBGL_POINT_THRESHOLD else 'svg')
+    fig.update_layout(hovermode="x unified") # Improves hover experience
+    return fig
+
 
 # --- Streamlit App Layout ---
 st.set_page_config(layout="wide", page_title="ESG Data Explorer")
 st.title("🌎 Global ESG Data Explorer")
 
 # Load data
-data = load_data()
+data, series_dict = load_data()
+
+# Load warnings are cached with the frame, so they are shown on every run, not only on the load that built it
+if data is not None:
+    for message in data.attrs.get('load_warnings', []):
+        st.warning(message)
+
+# Load diagnostics are only rendered when debugging, so normal reruns don't repaint them
+if DEBUG and data is not None:
+    with st.expander("Load debug", expanded=False):
+        st.write("Columns in merged data:", data.columns.tolist())
+        st.write("Shape of merged data:", data.shape)
+        st.dataframe(data.head()) # Show a preview of the merged data
 
 # Only proceed with UI if data loaded successfully and is not empty
 if data is not None and not data.empty:
@@ -149,34 +400,58 @@ if data is not None and not data.empty:
     # Sidebar Filters
     st.sidebar.header("⚙️ Filters")
 
+    # Option lists are precomputed per selection and cached, so they are not rebuilt on every rerun
+    load_id = data.attrs['load_id']
+    countries, years_by_country, series_by_selection = sidebar_options(load_id, data)
+    # Defaults for filters whose column is missing, so the selections always form a complete cache key
+    selected_country, selected_year, selected_series = 'All', 'All', []
+
     # Example: Simple filtering (customize as needed)
+    # The country is sliced out first; the remaining selections are ANDed into one boolean mask
+    # over that slice, applied once at the end.
+    # 'Country Name' and 'Series Name' are categoricals, so they are compared on their integer codes.
     # Ensure columns exist before attempting to filter
-    if 'Country Name' in data.columns:
-        countries = data['Country Name'].dropna().unique().tolist()
-        selected_country = st.sidebar.selectbox("Select Country", ['All'] + sorted(countries))
+    if countries is not None:
+        selected_country = st.sidebar.selectbox("Select Country", ['All'] + countries)
         if selected_country != 'All':
-            data = data[data['Country Name'] == selected_country]
+            # The loader sorts rows by country code, so the selected country is one contiguous block
+            country_col = data['Country Name']
+            code = country_col.cat.categories.get_loc(selected_country)
+            start, stop = np.searchsorted(country_col.cat.codes.to_numpy(), [code, code + 1])
+            data = data.iloc[start:stop]
     else:
         st.sidebar.info(" 'Country Name' column not found for filtering.")
 
-    if 'Year' in data.columns:
-        # Convert 'Year' to integer and drop NaNs for correct sorting and filtering
-        data['Year'] = pd.to_numeric(data['Year'], errors='coerce').dropna().astype(int)
-        years = data['Year'].unique().tolist()
-        selected_year = st.sidebar.selectbox("Select Year", ['All'] + sorted(years, reverse=True))
+    mask = np.ones(len(data), dtype=bool)
+
+    if years_by_country is not None:
+        selected_year = st.sidebar.selectbox("Select Year", ['All'] + years_by_country.get(selected_country, []))
         if selected_year != 'All':
-            data = data[data['Year'] == selected_year]
+            if selected_country != 'All':
+                # Within one country the loader's sort leaves the years ascending (missing years first,
+                # mapped below every real year), so the selected year is again one contiguous block
+                year_values = data['Year'].to_numpy(dtype=np.int32, na_value=np.iinfo(np.int32).min)
+                start, stop = np.searchsorted(year_values, [selected_year, selected_year + 1])
+                data = data.iloc[start:stop]
+                mask = mask[start:stop]
+            else:
+                # Rows with a missing Year never match
+                mask &= (data['Year'] == selected_year).to_numpy(dtype=bool, na_value=False)
     else:
         st.sidebar.info(" 'Year' column not found for filtering.")
 
-    if 'Series Name' in data.columns:
-        series_names = data['Series Name'].dropna().unique().tolist()
-        selected_series = st.sidebar.multiselect("Select Series Name(s)", sorted(series_names))
+    if series_by_selection is not None:
+        selected_series = st.sidebar.multiselect("Select Series Name(s)",
+                                                 series_by_selection.get((selected_country, selected_year), []))
         if selected_series:
-            data = data[data['Series Name'].isin(selected_series)]
+            series_col = data['Series Name']
+            mask &= np.isin(series_col.cat.codes.to_numpy(), series_col.cat.categories.get_indexer(selected_series))
     else:
         st.sidebar.info(" 'Series Name' column not found for filtering.")
 
+    if not mask.all():
+        data = data[mask]
+
 
     st.subheader("Filtered Data Preview")
     if not data.empty:
@@ -192,13 +467,12 @@ if data is not None and not data.empty:
     # Example: Display a simple metric
     st.subheader("Key Statistics (Filtered Data)")
     if 'Value' in data.columns:
-        # Ensure 'Value' is numeric for calculations
-        data['Value'] = pd.to_numeric(data['Value'], errors='coerce')
-        # Drop NaNs for sum calculation
-        valid_values = data['Value'].dropna()
-        if not valid_values.empty:
-            st.metric("Total Value (Filtered)", f"{valid_values.sum():,.2f}")
-            st.metric("Average Value (Filtered)", f"{valid_values.mean():,.2f}")
+        # 'Value' is already float32 from the loader. The NaN-aware numpy reductions run directly on
+        # that array (no dropna copy) and accumulate in float64 so the totals keep their precision.
+        values = data['Value'].to_numpy()
+        if np.count_nonzero(~np.isnan(values)):
+            st.metric("Total Value (Filtered)", f"{np.nansum(values, dtype=np.float64):,.2f}")
+            st.metric("Average Value (Filtered)", f"{np.nanmean(values, dtype=np.float64):,.2f}")
         else:
             st.info("No valid 'Value' data to calculate statistics with current filters.")
     else:
@@ -208,21 +482,11 @@ if data is not None and not data.empty:
     # Example Plotly Plot
     if 'Year' in data.columns and 'Value' in data.columns and 'Series Name' in data.columns:
         st.subheader("Value Over Time by Series")
-        # Ensure 'Value' is numeric and 'Year' is suitable for plotting
-        plot_data = data.dropna(subset=['Year', 'Value', 'Series Name']).copy() # Use .copy() to avoid SettingWithCopyWarning
-        plot_data['Value'] = pd.to_numeric(plot_data['Value'], errors='coerce')
-        plot_data['Year'] = pd.to_numeric(plot_data['Year'], errors='coerce').astype(int) # Ensure Year is int for plotting
-
-        if not plot_data.empty:
-            # Aggregate data for cleaner line plots if many series or data points
-            plot_data_agg = plot_data.groupby(['Year', 'Series Name'])['Value'].mean().reset_index()
-
-            fig = px.line(plot_data_agg, x='Year', y='Value', color='Series Name',
-                          title='Average ESG Value Trends by Series',
-                          labels={'Value': 'Average ESG Value', 'Year': 'Year'},
-                          hover_name='Series Name',
-                          markers=True) # Add markers for clarity
-            fig.update_layout(hovermode="x unified") # Improves hover experience
+        # Aggregate data for cleaner line plots if many series or data points
+        plot_data_agg = series_trend(load_id, (selected_country, selected_year, tuple(selected_series)), data)
+
+        if not plot_data_agg.empty:
+            fig = build_line_figure(plot_data_agg)
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Not enough valid 'Year', 'Value', and 'Series Name' data to generate the line plot with current filters.")
@@ -232,8 +496,8 @@ if data is not None and not data.empty:
     # Add more complex plots or analysis here
     st.header("📚 Data Dictionary")
     st.write("This section could provide details about the columns in your merged dataset.")
-    if 'Series Name' in data.columns and 'Definition' in data.columns:
-        st.dataframe(data[['Series Code', 'Series Name', 'Definition']].drop_duplicates().set_index('Series Code'))
+    if series_dict is not None:
+        st.dataframe(series_dict)
     else:
         st.info("Columns 'Series Name' or 'Definition' not available for data dictionary.")
 